@@ -0,0 +1,87 @@
+"""
+Admission control for requests that hold large bodies in memory.
+
+Uploads reserve an estimate of the memory they will use from a shared
+budget before their body is read. When the budget is used up they wait in
+FIFO order until enough is released, and give up at their deadline or when
+the queue itself is full, so a burst of large files queues or gets turned
+away instead of running the worker out of memory.
+"""
+import threading
+import time
+from collections import deque
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class ByteBudget:
+    def __init__(self, max_bytes, max_queued_bytes=None, max_queued_requests=None):
+        self.max_bytes = max_bytes
+        self.max_queued_bytes = max_bytes if max_queued_bytes is None else max_queued_bytes
+        # Every waiter parks a server thread, so keep some free for other requests
+        self.max_queued_requests = max_queued_requests
+        self.in_use_bytes = 0
+        self.queued_bytes = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()
+        self._condition = threading.Condition()
+
+    def acquire(self, size, timeout):
+        """
+        Reserve `size` bytes, waiting up to `timeout` seconds for them.
+
+        Returns the number of bytes reserved, to be passed to release(). A
+        request bigger than the whole budget reserves all of it, so it runs
+        alone instead of never running. Raises AdmissionRejected when the
+        queue is full or the deadline passes.
+        """
+        size = min(size, self.max_bytes)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if not self._waiters and self.in_use_bytes + size <= self.max_bytes:
+                self.in_use_bytes += size
+                self.admitted += 1
+                return size
+            if self.queued_bytes + size > self.max_queued_bytes or (
+                self.max_queued_requests is not None and len(self._waiters) >= self.max_queued_requests
+            ):
+                self.rejected += 1
+                raise AdmissionRejected("Upload queue is full")
+
+            waiter = object()
+            self._waiters.append(waiter)
+            self.queued_bytes += size
+            try:
+                while self._waiters[0] is not waiter or self.in_use_bytes + size > self.max_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected("Timed out waiting for upload memory budget")
+                    self._condition.wait(remaining)
+                self.in_use_bytes += size
+                self.admitted += 1
+                return size
+            finally:
+                self._waiters.remove(waiter)
+                self.queued_bytes -= size
+                # The next waiter in line may fit now
+                self._condition.notify_all()
+
+    def release(self, size):
+        with self._condition:
+            self.in_use_bytes -= size
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "maxBytes": self.max_bytes,
+                "inUseBytes": self.in_use_bytes,
+                "queuedBytes": self.queued_bytes,
+                "queuedRequests": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,80 @@
+"""
+Swagger UI and API spec serving.
+
+flasgger rebuilds the spec from every route docstring each time it is
+fetched. Here the spec is built once, on the first request (or read from a
+file precompiled with `flask build-apispec`), then served from memory with
+an ETag so clients can revalidate it cheaply.
+"""
+import hashlib
+import json
+import threading
+
+import click
+from flask import Response, request
+
+
+def swag_from(specs):
+    """
+    Attach a spec dict to a view, like flasgger's swag_from does for dicts,
+    without importing flasgger (and jsonschema) when the docs are disabled.
+    """
+    def decorator(function):
+        function.specs_dict = specs
+        return function
+    return decorator
+
+
+def init_swagger(app, enabled=True, spec_file=None):
+    """Register the Swagger UI and cached spec views, unless disabled."""
+    if not enabled:
+        return None
+
+    from flasgger import Swagger
+
+    swagger = Swagger(app)
+    blueprint = swagger.config.get("endpoint", "flasgger")
+    for spec in swagger.config["specs"]:
+        endpoint = spec["endpoint"]
+        app.view_functions[f"{blueprint}.{endpoint}"] = _cached_spec_view(swagger, endpoint, spec_file)
+
+    @app.cli.command("build-apispec")
+    @click.argument("output", default=spec_file or "apispec.json")
+    def build_apispec(output):
+        """Precompile the API spec into a static JSON file."""
+        endpoint = swagger.config["specs"][0]["endpoint"]
+        with app.test_request_context():
+            specs = swagger.get_apispecs(endpoint)
+        with open(output, "w") as f:
+            json.dump(specs, f)
+        click.echo(f"Wrote {output}")
+
+    return swagger
+
+
+def _cached_spec_view(swagger, endpoint, spec_file):
+    cache = {}
+    lock = threading.Lock()
+
+    def load():
+        if spec_file:
+            try:
+                with open(spec_file, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        return json.dumps(swagger.get_apispecs(endpoint)).encode("utf-8")
+
+    def apispec():
+        if not cache:
+            with lock:
+                if not cache:
+                    body = load()
+                    cache["etag"] = hashlib.sha256(body).hexdigest()
+                    cache["body"] = body
+        response = Response(cache["body"], mimetype="application/json")
+        response.set_etag(cache["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+    return apispec
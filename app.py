@@ -1,22 +1,179 @@
-from flask import Flask, request, jsonify
-from flasgger import Swagger, swag_from
-import requests
+from flask import Flask, request, jsonify, g
+import json
+import math
 import os
-import base64
+import threading
+import time
+import click
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
+from admission import AdmissionRejected, ByteBudget
+from api_docs import init_swagger, swag_from
+from batch import BatchStats, run_batches
+from file_store import FileStore
+from lazy_imports import lazy_import
+from reactivation import ReactivationJob
+from tenants import DEFAULT_TENANT_ID, RateLimiter, Tenant, TenantRegistry
+from tracing import ConsoleExporter, FileExporter, init_tracing, span
+from validation import init_validation
 
 load_dotenv()
 
+# Defer loading the upstream HTTP client until the first upstream call
+if os.getenv("LAZY_IMPORTS", "false").lower() == "true":
+    requests = lazy_import("requests")
+else:
+    import requests
+
 app = Flask(__name__)
-swagger = Swagger(app)
 
 
 SANDBOX_URL = os.getenv("SANDBOX_URL")
 SANDBOX_BASE_URL = os.getenv("SANDBOX_BASE_URL")
 X_AUTH_TOKEN = os.getenv("X_AUTH_TOKEN")
+FILE_STORE_DIR = os.getenv("FILE_STORE_DIR", "file_store")
+FILE_STORE_MAX_BYTES = int(os.getenv("FILE_STORE_MAX_BYTES", 512 * 1024 * 1024))
+FILE_STORE_RESCAN_INTERVAL = float(os.getenv("FILE_STORE_RESCAN_INTERVAL", 10))
+SWAGGER_ENABLED = os.getenv("SWAGGER_ENABLED", "true").lower() == "true"
+SWAGGER_SPEC_FILE = os.getenv("SWAGGER_SPEC_FILE")
+TENANTS_CONFIG = os.getenv("TENANTS_CONFIG")
+TENANTS_RELOAD_INTERVAL = float(os.getenv("TENANTS_RELOAD_INTERVAL", 5))
+TENANTS_TRUSTED_NETWORKS = [
+    network.strip() for network in os.getenv("TENANTS_TRUSTED_NETWORKS", "").split(",") if network.strip()
+]
+# Number of proxies in front of the app whose X-Forwarded-For is trusted
+PROXY_HOPS = int(os.getenv("PROXY_HOPS", 0))
+# Set by gunicorn.conf.py; per-tenant rate limits are split between workers
+SERVER_WORKERS = int(os.getenv("GUNICORN_WORKERS", 1))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", 10))
+RESEND_BATCH_SIZE = int(os.getenv("RESEND_BATCH_SIZE", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_RATE_LIMIT_TIMEOUT = float(os.getenv("BATCH_RATE_LIMIT_TIMEOUT", 30))
+BATCH_TIME_LIMIT = float(os.getenv("BATCH_TIME_LIMIT", 60))
+REACTIVATION_STATE_DIR = os.getenv("REACTIVATION_STATE_DIR", "reactivation_jobs")
+REACTIVATION_CONCURRENCY = int(os.getenv("REACTIVATION_CONCURRENCY", 4))
+REACTIVATION_RATE_LIMIT = float(os.getenv("REACTIVATION_RATE_LIMIT", 0))
+REACTIVATION_EXPIRED_STATUS = os.getenv("REACTIVATION_EXPIRED_STATUS", "EXPIRED")
+REACTIVATION_MAX_DOCUMENTS = int(os.getenv("REACTIVATION_MAX_DOCUMENTS", 1000))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 25 * 1024 * 1024))
+UPLOAD_ADMISSION_THRESHOLD = int(os.getenv("UPLOAD_ADMISSION_THRESHOLD", 1024 * 1024))
+UPLOAD_MEMORY_BUDGET = int(os.getenv("UPLOAD_MEMORY_BUDGET", 256 * 1024 * 1024))
+UPLOAD_MEMORY_FACTOR = float(os.getenv("UPLOAD_MEMORY_FACTOR", 3))
+UPLOAD_MAX_QUEUED_BYTES = int(os.getenv("UPLOAD_MAX_QUEUED_BYTES", UPLOAD_MEMORY_BUDGET))
+# Keep below GUNICORN_THREADS, every queued upload holds a thread while it waits
+UPLOAD_MAX_QUEUED_REQUESTS = int(os.getenv("UPLOAD_MAX_QUEUED_REQUESTS", 2))
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", 10))
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", 5))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 1000))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+
+if PROXY_HOPS:
+    # Take the client address from X-Forwarded-For so TENANTS_TRUSTED_NETWORKS
+    # matches clients rather than the load balancer
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+# Registered first so the trace covers the other request hooks too
+if TRACE_EXPORTER == "console":
+    init_tracing(app, ConsoleExporter(), TRACE_SLOW_MS, TRACE_SAMPLE_RATE)
+elif TRACE_EXPORTER == "file":
+    init_tracing(app, FileExporter(TRACE_FILE), TRACE_SLOW_MS, TRACE_SAMPLE_RATE)
+
+swagger = init_swagger(app, enabled=SWAGGER_ENABLED, spec_file=SWAGGER_SPEC_FILE)
+file_store = FileStore(FILE_STORE_DIR, FILE_STORE_MAX_BYTES, FILE_STORE_RESCAN_INTERVAL)
+batch_stats = BatchStats()
+
+# Requests without a tenant header use the environment settings above,
+# which keeps single-tenant deployments working without a config file
+default_tenant = None
+if X_AUTH_TOKEN or not TENANTS_CONFIG:
+    default_tenant = Tenant(DEFAULT_TENANT_ID, X_AUTH_TOKEN, SANDBOX_URL, SANDBOX_BASE_URL, pool_size=UPSTREAM_POOL_SIZE)
+tenant_registry = TenantRegistry(
+    default_tenant, TENANTS_CONFIG, TENANTS_RELOAD_INTERVAL, TENANTS_TRUSTED_NETWORKS, SERVER_WORKERS
+)
+
+
+@app.before_request
+def resolve_tenant():
+    # Docs and metrics don't talk to the upstream
+    if request.blueprint == "flasgger" or request.endpoint in (None, "static", "metrics"):
+        return None
+
+    tenant = tenant_registry.resolve(
+        request.headers.get("X-Tenant-Id"), request.headers.get("X-Api-Key"), request.remote_addr
+    )
+    if tenant is None:
+        return jsonify({"error": "Unknown tenant"}), 401
+
+    if tenant.rate_limiter is not None:
+        retry_after = tenant.rate_limiter.try_acquire()
+        if retry_after:
+            return jsonify({"error": "Rate limit exceeded"}), 429, {"Retry-After": str(math.ceil(retry_after))}
+
+    g.tenant = tenant
+    return None
+
+
+# Files sent upstream are held in memory while they are encoded, so large
+# ones reserve memory from a shared budget before their body is read. The
+# budget is per worker process. /upload_file only streams to disk (Werkzeug
+# spools large bodies to a temporary file) and just gets the size limit.
+upload_budget = ByteBudget(UPLOAD_MEMORY_BUDGET, UPLOAD_MAX_QUEUED_BYTES, UPLOAD_MAX_QUEUED_REQUESTS)
+UPLOAD_ENDPOINTS = ("create_esigning_request", "upload_file")
+IN_MEMORY_UPLOAD_ENDPOINTS = ("create_esigning_request",)
+
+
+def _reserve_upload_memory(file_size):
+    """Reserve memory for handling a file of `file_size` bytes; an error response if rejected."""
+    if file_size < UPLOAD_ADMISSION_THRESHOLD:
+        return None
+    size = int(file_size * UPLOAD_MEMORY_FACTOR)
+    try:
+        with span("admission_wait", bytes=size):
+            reserved = upload_budget.acquire(size, UPLOAD_QUEUE_TIMEOUT)
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(UPLOAD_RETRY_AFTER)}
+    g.upload_reservation = g.get("upload_reservation", 0) + reserved
+    return None
+
+
+@app.before_request
+def admit_upload():
+    if request.endpoint not in UPLOAD_ENDPOINTS:
+        return None
+
+    content_length = request.content_length
+    if content_length is not None and content_length > UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"Request body is larger than {UPLOAD_MAX_BYTES} bytes"}), 413
+    if request.endpoint not in IN_MEMORY_UPLOAD_ENDPOINTS:
+        return None
+    # Chunked uploads don't announce their size, assume the largest allowed
+    return _reserve_upload_memory(UPLOAD_MAX_BYTES if content_length is None else content_length)
+
+
+@app.teardown_request
+def release_upload(error=None):
+    reserved = g.pop("upload_reservation", None)
+    if reserved is not None:
+        upload_budget.release(reserved)
+
 
 spec = {"tags":["eSigning Gateway"]}
 
+def _upstream_json_response(response):
+    with span("response_parse"):
+        try:
+            response_json = response.json()
+        except Exception as e:
+            response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
+
+    with span("jsonify"):
+        return jsonify(response_json), response.status_code
+
+
 @app.route("/check_transaction_status", methods=["GET"])
 @swag_from(spec)
 def get_transaction_status():
@@ -76,17 +233,14 @@ def get_transaction_status():
     # Retrieve documentId from request parameters
     doc_id = request.args.get("documentId")
 
-    # Check if documentId is provided
-    if not doc_id:
-        raise ValueError("documentId is required in the request parameters.")
-
     # Set request headers and parameters
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     parameters = {"documentId": doc_id}
     try:
-        response = requests.get(url=f"{SANDBOX_URL}", params=parameters, headers=headers)
+        response = g.tenant.session.get(url=f"{g.tenant.sandbox_url}", params=parameters, headers=headers)
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        result = response.json()
+        with span("response_parse"):
+            result = response.json()
         # Check transaction status
         if result["status"] == 1:
             result["data"].pop("files", None)
@@ -111,16 +265,14 @@ def create_esigning_request():
     # tags:
     #   - eSigning Gateway
     parameters:
-      - in: formData
-        name: file
-        type: file
-        required: true
-        description: The file to be uploaded and converted.
       - name: requestBody
         in: body
         required: true
         # description: Provide the ID of the Workflow from your Leegality Dashboard.
         schema:
+          required:
+            - profileId
+            - name
           properties:
             profileId:
               type: string
@@ -130,7 +282,10 @@ def create_esigning_request():
               description: The last name of the user.
             file:
               type: string
-              description: The date of birth of the user (YYYY-MM-DD).
+              description: The base64 encoded file. Not needed when fileHash is given.
+            fileHash:
+              type: string
+              description: SHA-256 of a file previously stored through /upload_file.
     responses:
       200:
         description: Transaction status retrieved successfully.
@@ -159,6 +314,18 @@ def create_esigning_request():
           application/json:
             example:
               error: "Invalid request format"
+      413:
+        description: The upload is larger than UPLOAD_MAX_BYTES.
+        content:
+          application/json:
+            example:
+              error: "Request body is larger than 26214400 bytes"
+      503:
+        description: Too many large uploads in progress, retry after the Retry-After header.
+        content:
+          application/json:
+            example:
+              error: "Timed out waiting for upload memory budget"
       500:
         description: Failed to retrieve transaction status.
         content:
@@ -169,20 +336,34 @@ def create_esigning_request():
     data = request.get_json()
 
     # Check if required fields are present in the JSON request
-    if "profileId" not in data or "name" not in data or "file" not in data:
-        raise ValueError("Required fields (profileId, name, file) are missing in the JSON request.")
+    if "file" not in data and "fileHash" not in data:
+        return jsonify({"error": "Either 'file' or 'fileHash' is required in the request body"}), 400
     print("After IF")
-    image = request.files['image']  
-    file_content = base64.b64encode(image.read())
+    if "fileHash" in data:
+        # Reuse a previously uploaded file instead of re-reading and re-encoding it.
+        # The request itself is small, but the file's encoding and the upstream
+        # payload are held in memory like an upload's.
+        file_size = file_store.size(data["fileHash"], g.tenant.cache_namespace)
+        if file_size is None:
+            return jsonify({"error": "Unknown fileHash"}), 404
+        rejected = _reserve_upload_memory(file_size)
+        if rejected is not None:
+            return rejected
+        with span("base64_encode") as encode_span:
+            file_content, cached = file_store.get_base64(data["fileHash"], g.tenant.cache_namespace)
+            if encode_span is not None:
+                encode_span.attributes["cached"] = cached
+        if file_content is None:
+            return jsonify({"error": "Unknown fileHash"}), 404
+    else:
+        # Uploads go through /upload_file and are referenced by fileHash
+        file_content = data["file"]
     # Extract data from the JSON request
     profileId = data["profileId"]
     name = data["name"]
-    print(f"image is {image}")
     print(f"name is {name}")
     print(f"profile id is {profileId}")
-    print(f"file content is {file_content}")
-    # file_content = data["file"]
-    headers = {"X-Auth-Token": X_AUTH_TOKEN, "Content-Type": "application/json"}
+    headers = {"X-Auth-Token": g.tenant.token, "Content-Type": "application/json"}
     payload = {
         "profileId": profileId,
         "file": {
@@ -248,19 +429,108 @@ def create_esigning_request():
             ]
         }
     }
-    response = requests.post(url=SANDBOX_URL, headers=headers, json=payload)
+    response = g.tenant.session.post(url=g.tenant.sandbox_url, headers=headers, json=payload)
     try:
-        text = response.json()
+        with span("response_parse"):
+            text = response.json()
         print("Type of text is ", type(text))
-        try:
-            response_json = response.json()
-        except Exception as e:
-            response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
-
-        return jsonify(response_json), response.status_code
+        with span("jsonify"):
+            return jsonify(text), response.status_code
     except:
         return "Failed"
 
+@app.route("/upload_file", methods=["POST"])
+@swag_from(spec)
+def upload_file():
+    """
+    Store a file so later requests can reference it by its hash.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    consumes:
+      - multipart/form-data
+    parameters:
+      - in: formData
+        name: image
+        type: file
+        required: true
+        description: The file to be stored.
+
+    responses:
+      200:
+        description: File stored successfully.
+        content:
+          application/json:
+            example:
+              fileHash: "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+      400:
+        description: Bad Request.
+        content:
+          application/json:
+            example:
+              error: "Missing 'image' file in the request"
+      413:
+        description: The upload is larger than UPLOAD_MAX_BYTES.
+        content:
+          application/json:
+            example:
+              error: "Request body is larger than 26214400 bytes"
+    """
+    if "image" not in request.files:
+        return jsonify({"error": "Missing 'image' file in the request"}), 400
+
+    with span("file_read"):
+        file_hash = file_store.put(request.files["image"].stream, g.tenant.cache_namespace)
+    return jsonify({"fileHash": file_hash})
+
+
+@app.route("/metrics", methods=["GET"])
+@swag_from(spec)
+def metrics():
+    """
+    Gateway metrics.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    responses:
+      200:
+        description: Current metrics of this worker.
+        content:
+          application/json:
+            example:
+              fileStore:
+                entries: 12
+                bytes: 7340032
+                maxBytes: 536870912
+                hits: 30
+                misses: 12
+                hitRate: 0.714
+                evictions: 0
+              batches:
+                deleteInvitations:
+                  runs: 2
+                  items: 3000
+                  batches: 3000
+                  failed: 4
+                  elapsedMs: 41250.0
+                  itemsPerSecond: 72.7
+              admission:
+                maxBytes: 268435456
+                inUseBytes: 62914560
+                queuedBytes: 31457280
+                queuedRequests: 1
+                admitted: 418
+                rejected: 2
+    """
+    return jsonify({
+        "fileStore": file_store.stats(),
+        "batches": batch_stats.snapshot(),
+        "admission": upload_budget.stats(),
+    })
+
+
 @app.route("/delete_document", methods=["DELETE"])
 @swag_from(spec)
 def delete_document():
@@ -312,17 +582,12 @@ def delete_document():
               error: "Failed to delete document"
     """
     document_id = request.args.get("documentId")
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     parameters = {"documentId": document_id}
-    response = requests.delete(url=SANDBOX_URL, headers=headers, params=parameters)
+    response = g.tenant.session.delete(url=g.tenant.sandbox_url, headers=headers, params=parameters)
     print(response.status_code)
     print(response.text)
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
-
-    return jsonify(response_json), response.status_code
+    return _upstream_json_response(response)
 
 
 @app.route("/search", methods=["GET"])
@@ -377,16 +642,12 @@ def search():
     # Get query parameters from the request
     query = request.args.get('q')
 
-    # Check if the required 'q' parameter is present
-    if not query:
-        raise ValueError("The 'q' parameter is required in the request.")
-
     # Get optional parameters with default values
     status = request.args.get('status', None)
     max_records = request.args.get('max', 20, type=int)
 
     # Build the API URL with query parameters
-    api_url = f"{SANDBOX_URL}/list?q={query}"
+    api_url = f"{g.tenant.sandbox_url}/list?q={query}"
 
     if status is not None:
         api_url += f"&status={status}"
@@ -394,15 +655,16 @@ def search():
     api_url += f"&max={max_records}"
 
     # Set request headers
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
 
     try:
         # Make API request
-        response = requests.get(url=api_url, headers=headers)
+        response = g.tenant.session.get(url=api_url, headers=headers)
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
 
         # Process the response (optional)
-        text = response.json()
+        with span("response_parse"):
+            text = response.json()
 
         if text["status"] == 1:
             return "Success"
@@ -432,6 +694,8 @@ def reactivate_expired_documents():
         required: true
         schema:
           type: object
+          required:
+            - documentId
           properties:
             documentId:
               type: string
@@ -460,19 +724,15 @@ def reactivate_expired_documents():
     # Get JSON data from the request
     data = request.get_json()
 
-    # Check if the required 'documentId' parameter is present
-    if "documentId" not in data:
-        return jsonify({"error": "Missing 'documentId' in the request body"}), 400
-
     document_id = data["documentId"]
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     json_data = {
         "documentId": document_id
     }
 
     try:
         # Make API request
-        response = requests.post(url=SANDBOX_URL+"/reactivate", headers=headers, json=json_data)
+        response = g.tenant.session.post(url=g.tenant.sandbox_url+"/reactivate", headers=headers, json=json_data)
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
         # Print response status code and content
         return "reactivate_expired_documents success"
@@ -482,11 +742,247 @@ def reactivate_expired_documents():
         return jsonify({"error": f"Error: {str(e)}"}), 500
 
 
+def _select_expired_documents(tenant):
+    headers = {"X-Auth-Token": tenant.token}
+    parameters = {"status": REACTIVATION_EXPIRED_STATUS, "max": REACTIVATION_MAX_DOCUMENTS}
+    response = tenant.session.get(url=f"{tenant.sandbox_url}/list", headers=headers, params=parameters)
+    response.raise_for_status()
+    result = response.json()
+    documents = result.get("data") if isinstance(result, dict) else None
+    if not isinstance(documents, list) or not all(isinstance(document, dict) for document in documents):
+        raise ValueError("Unexpected response from the upstream document list: 'data' is not a list of documents")
+    return [document["documentId"] for document in documents if "documentId" in document]
+
+
+def _prepare_reactivation_job(tenant, document_ids=None, job_id=None):
+    """Load the job to resume, or create one for the given or selected documents."""
+    if job_id:
+        job = ReactivationJob.load(REACTIVATION_STATE_DIR, job_id)
+        if job is None or job.meta["tenantId"] != tenant.tenant_id:
+            return None
+        return job
+    if document_ids is None:
+        document_ids = _select_expired_documents(tenant)
+    return ReactivationJob.create(REACTIVATION_STATE_DIR, document_ids, tenant.tenant_id)
+
+
+def _run_reactivation_job(job, tenant):
+    """Run a job whose lock the caller has taken, and release it when done."""
+    headers = {"X-Auth-Token": tenant.token}
+    job_rate_limiter = RateLimiter(REACTIVATION_RATE_LIMIT) if REACTIVATION_RATE_LIMIT else None
+
+    def reactivate(document_id):
+        response = tenant.session.post(url=tenant.sandbox_url + "/reactivate", headers=headers, json={"documentId": document_id})
+        return _batch_outcome(response)
+
+    try:
+        # Rate limits are waited for before taking one of the tenant's batch
+        # slots, and without a timeout since nobody waits on a background job
+        return job.run(reactivate, REACTIVATION_CONCURRENCY, (job_rate_limiter, tenant.rate_limiter), None, tenant.batch_slots)
+    finally:
+        job.unlock()
+
+
+@app.route("/reactivate_expired_documents_bulk", methods=["POST"])
+@swag_from(spec)
+def reactivate_expired_documents_bulk():
+    """
+    Start a bulk reactivation job.
+
+    Reactivates the given documents, or the expired documents listed by the
+    upstream when no documentIds are given. The job runs in the background;
+    poll /reactivate_expired_documents_bulk/{jobId} for its progress. Pass
+    the jobId of an interrupted job to resume it.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            documentIds:
+              type: array
+              items:
+                type: string
+              description: The documents to reactivate (optional).
+            jobId:
+              type: string
+              description: The job to resume (optional).
+            dryRun:
+              type: boolean
+              description: Only list the documents that would be reactivated.
+
+    responses:
+      202:
+        description: Job started.
+        content:
+          application/json:
+            example:
+              jobId: "5f0c6c1d2b7e4f7e9a3b7d2c1e0f9a8b"
+              tenantId: "default"
+              status: "running"
+              total: 2500
+              succeeded: 0
+              failed: 0
+              pending: 2500
+              elapsedMs: 0.0
+              documentsPerSecond: 0.0
+              failures: []
+      404:
+        description: Unknown job.
+        content:
+          application/json:
+            example:
+              error: "Unknown jobId"
+      409:
+        description: The job is already running.
+        content:
+          application/json:
+            example:
+              error: "Job is already running"
+      502:
+        description: The upstream document list had an unexpected format.
+        content:
+          application/json:
+            example:
+              error: "Unexpected response from the upstream document list: 'data' is not a list of documents"
+      500:
+        description: Internal Server Error.
+        content:
+          application/json:
+            example:
+              error: "Error: Internal Server Error"
+    """
+    data = request.get_json()
+    tenant = g.tenant
+
+    try:
+        if data.get("dryRun", False):
+            document_ids = data.get("documentIds")
+            if document_ids is None:
+                document_ids = _select_expired_documents(tenant)
+            return jsonify({"dryRun": True, "total": len(document_ids), "documentIds": document_ids})
+
+        job = _prepare_reactivation_job(tenant, data.get("documentIds"), data.get("jobId"))
+    except ValueError as e:
+        # Also covers a response body that isn't JSON
+        return jsonify({"error": str(e)}), 502
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Error: {str(e)}"}), 500
+
+    if job is None:
+        return jsonify({"error": "Unknown jobId"}), 404
+
+    # The lock is shared by all workers, so a job only runs in one of them
+    if not job.try_lock():
+        return jsonify({"error": "Job is already running"}), 409
+    job.meta["status"] = "running"
+    threading.Thread(target=_run_reactivation_job, args=(job, tenant), daemon=True).start()
+
+    return jsonify(job.report()), 202
+
+
+@app.route("/reactivate_expired_documents_bulk/<job_id>", methods=["GET"])
+@swag_from(spec)
+def reactivate_expired_documents_bulk_status(job_id):
+    """
+    Progress of a bulk reactivation job.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+        description: The ID returned when the job was started.
+
+    responses:
+      200:
+        description: Job progress.
+        content:
+          application/json:
+            example:
+              jobId: "5f0c6c1d2b7e4f7e9a3b7d2c1e0f9a8b"
+              tenantId: "default"
+              status: "finished"
+              total: 2500
+              succeeded: 2497
+              failed: 3
+              pending: 0
+              elapsedMs: 148230.5
+              documentsPerSecond: 16.9
+              failures:
+                - documentId: "FT803AA037"
+                  success: false
+                  status: 400
+                  error:
+                    - code: "400"
+                      message: "Document is not expired"
+      404:
+        description: Unknown job.
+        content:
+          application/json:
+            example:
+              error: "Unknown jobId"
+    """
+    job = ReactivationJob.load(REACTIVATION_STATE_DIR, job_id)
+    if job is None or job.meta["tenantId"] != g.tenant.tenant_id:
+        return jsonify({"error": "Unknown jobId"}), 404
+    return jsonify(job.report())
+
+
+@app.cli.command("reactivate-expired")
+@click.option("--tenant", "tenant_id", default=None, help="Tenant to run as (default: the environment settings).")
+@click.option("--document-id", "document_ids", multiple=True, help="Document to reactivate, can be repeated.")
+@click.option("--file", "ids_file", type=click.File(), help="File with one document ID per line.")
+@click.option("--job-id", default=None, help="Resume an interrupted job.")
+@click.option("--dry-run", is_flag=True, help="Only list the documents that would be reactivated.")
+def reactivate_expired_command(tenant_id, document_ids, ids_file, job_id, dry_run):
+    """Reactivate expired documents in bulk, e.g. from a daily cron job."""
+    tenant = tenant_registry.get(tenant_id)
+    if tenant is None:
+        raise click.ClickException(f"Unknown tenant {tenant_id!r}")
+
+    document_ids = list(document_ids)
+    if ids_file is not None:
+        document_ids.extend(line.strip() for line in ids_file if line.strip())
+
+    try:
+        if dry_run:
+            document_ids = document_ids or _select_expired_documents(tenant)
+            click.echo("\n".join(document_ids))
+            click.echo(f"{len(document_ids)} documents would be reactivated", err=True)
+            return
+
+        job = _prepare_reactivation_job(tenant, document_ids or None, job_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    except requests.exceptions.RequestException as e:
+        raise click.ClickException(f"Upstream request failed: {e}")
+    if job is None:
+        raise click.ClickException(f"Unknown job {job_id!r}")
+    if not job.try_lock():
+        raise click.ClickException(f"Job {job.job_id} is already running")
+    click.echo(f"Job {job.job_id}: {len(job.meta['documentIds'])} documents", err=True)
+    report = _run_reactivation_job(job, tenant)
+    click.echo(json.dumps(report, indent=2))
+    if report["failed"]:
+        raise SystemExit(1)
+
+
 @app.route("/resend_notifications", methods=["POST"])
 @swag_from(spec)
 def resend_notifications():
     """
-    Reactivate expired documents.
+    Resend notifications to invitees.
 
     ---
     # tags:
@@ -499,24 +995,30 @@ def resend_notifications():
         required: true
         schema:
           type: object
+          required:
+            - signUrls
           properties:
-            documentId:
-              type: string
-              description: The ID of the document to reactivate.
+            signUrls:
+              type: array
+              items:
+                type: string
+              description: The sign URLs of the invitations to notify again.
 
     responses:
       200:
-        description: Document reactivation successful.
+        description: Notifications resent successfully.
         content:
           application/json:
             example:
-              result: "reactivate_expired_documents success"
+              status: 1
+              messages: []
+              data: {}
       400:
         description: Bad Request.
         content:
           application/json:
             example:
-              error: "Missing 'documentId' in the request body"
+              error: "Missing 'signUrls' in the request body"
       500:
         description: Internal Server Error.
         content:
@@ -526,20 +1028,12 @@ def resend_notifications():
     """
     data = request.get_json()
 
-    if "signUrls" not in data or not isinstance(data["signUrls"], list):
-        return jsonify({"error": "Invalid Data"}), 400
-
     sign_urls = data["signUrls"]
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     json_data = {"signUrls": sign_urls}
-    response = requests.post(url=f"{SANDBOX_URL}/resend", headers=headers, json=json_data)
-
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
+    response = g.tenant.session.post(url=f"{g.tenant.sandbox_url}/resend", headers=headers, json=json_data)
 
-    return jsonify(response_json), response.status_code
+    return _upstream_json_response(response)
 
 
 @app.route("/delete_invitation", methods=["DELETE"])
@@ -581,19 +1075,205 @@ def delete_invitation():
               error: "Error: Internal Server Error"
     """
     sign_url = request.args.get('signUrl')
-    DELETE_URL = SANDBOX_URL + "/invitation"
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    DELETE_URL = g.tenant.sandbox_url + "/invitation"
+    headers = {"X-Auth-Token": g.tenant.token}
     parameters = {
         "signUrl": sign_url
     }
-    response = requests.delete(url=DELETE_URL, headers=headers, params=parameters)
+    response = g.tenant.session.delete(url=DELETE_URL, headers=headers, params=parameters)
     print(response.status_code)
+    return _upstream_json_response(response)
+
+
+def _batch_outcome(response):
     try:
         response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
+    except Exception:
+        response_json = {}
+    success = response.ok and response_json.get("status", 1) == 1
+    outcome = {"success": success, "status": response.status_code}
+    if not success:
+        outcome["error"] = response_json.get("messages") or response.text[:200]
+    return outcome
+
+
+def _time_left(deadline):
+    """Upstream timeout for a call that has to finish by `deadline` (time.monotonic())."""
+    return max(0.1, deadline - time.monotonic())
+
+
+@app.route("/resend_notifications_batch", methods=["POST"])
+@swag_from(spec)
+def resend_notifications_batch():
+    """
+    Resend notifications for a large list of invitations.
+
+    The sign URLs are sent to the upstream in batches of RESEND_BATCH_SIZE,
+    up to BATCH_CONCURRENCY batches at a time. Every URL of a batch gets
+    that batch's result.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - signUrls
+          properties:
+            signUrls:
+              type: array
+              maxItems: 1000
+              items:
+                type: string
+              description: The sign URLs of the invitations to notify again, at most 1000.
+            dryRun:
+              type: boolean
+              description: Only report how the URLs would be batched, without calling the upstream.
+
+    responses:
+      200:
+        description: Per-URL results and throughput of the batch.
+        content:
+          application/json:
+            example:
+              results:
+                - signUrl: "https://sandbox.leegality.com/sign/73bca1a0-9bdd-4b5b-80ff-34d4a144e78b"
+                  success: true
+                  status: 200
+                - signUrl: "https://sandbox.leegality.com/sign/0b1f6c1e-3c55-4a0e-a4b6-1f0d1f8a9e21"
+                  success: false
+                  status: 400
+                  error:
+                    - code: "400"
+                      message: "Invitation not found"
+              metrics:
+                items: 2
+                batches: 2
+                succeeded: 1
+                failed: 1
+                elapsedMs: 412.3
+                itemsPerSecond: 4.9
+                dryRun: false
+      400:
+        description: Bad Request.
+        content:
+          application/json:
+            example:
+              error: "'body.signUrls' must have at most 1000 items"
+    """
+    data = request.get_json()
+    sign_urls = list(dict.fromkeys(data["signUrls"]))
+    tenant = g.tenant
+    headers = {"X-Auth-Token": tenant.token}
+
+    deadline = time.monotonic() + BATCH_TIME_LIMIT
+
+    def resend(batch):
+        response = tenant.session.post(
+            url=f"{tenant.sandbox_url}/resend", headers=headers, json={"signUrls": batch}, timeout=_time_left(deadline)
+        )
+        return _batch_outcome(response)
+
+    results, metrics = run_batches(
+        sign_urls, RESEND_BATCH_SIZE, BATCH_CONCURRENCY, resend,
+        rate_limiters=(tenant.rate_limiter,), rate_limit_timeout=BATCH_RATE_LIMIT_TIMEOUT,
+        dry_run=data.get("dryRun", False), slots=tenant.batch_slots, time_limit=BATCH_TIME_LIMIT,
+    )
+    batch_stats.record("resendNotifications", metrics)
+    return jsonify({"results": [dict(outcome, signUrl=url) for url, outcome in results], "metrics": metrics})
+
+
+@app.route("/delete_invitations_batch", methods=["POST"])
+@swag_from(spec)
+def delete_invitations_batch():
+    """
+    Delete a large list of invitations.
+
+    The upstream deletes one invitation per call, so the calls run
+    concurrently, up to BATCH_CONCURRENCY at a time.
+
+    ---
+    # tags:
+    #   - eSigning Gateway
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - signUrls
+          properties:
+            signUrls:
+              type: array
+              maxItems: 1000
+              items:
+                type: string
+              description: The sign URLs of the invitations to delete, at most 1000.
+            dryRun:
+              type: boolean
+              description: Only report what would be deleted, without calling the upstream.
 
-    return jsonify(response_json), response.status_code
+    responses:
+      200:
+        description: Per-URL results and throughput of the batch.
+        content:
+          application/json:
+            example:
+              results:
+                - signUrl: "https://sandbox.leegality.com/sign/73bca1a0-9bdd-4b5b-80ff-34d4a144e78b"
+                  success: true
+                  status: 200
+                - signUrl: "https://sandbox.leegality.com/sign/0b1f6c1e-3c55-4a0e-a4b6-1f0d1f8a9e21"
+                  success: false
+                  status: 400
+                  error:
+                    - code: "400"
+                      message: "Invitation not found"
+              metrics:
+                items: 2
+                batches: 2
+                succeeded: 1
+                failed: 1
+                elapsedMs: 412.3
+                itemsPerSecond: 4.9
+                dryRun: false
+      400:
+        description: Bad Request.
+        content:
+          application/json:
+            example:
+              error: "'body.signUrls' must have at most 1000 items"
+    """
+    data = request.get_json()
+    sign_urls = list(dict.fromkeys(data["signUrls"]))
+    tenant = g.tenant
+    headers = {"X-Auth-Token": tenant.token}
+
+    deadline = time.monotonic() + BATCH_TIME_LIMIT
+
+    def delete(batch):
+        response = tenant.session.delete(
+            url=f"{tenant.sandbox_url}/invitation", headers=headers, params={"signUrl": batch[0]},
+            timeout=_time_left(deadline),
+        )
+        return _batch_outcome(response)
+
+    results, metrics = run_batches(
+        sign_urls, 1, BATCH_CONCURRENCY, delete,
+        rate_limiters=(tenant.rate_limiter,), rate_limit_timeout=BATCH_RATE_LIMIT_TIMEOUT,
+        dry_run=data.get("dryRun", False), slots=tenant.batch_slots, time_limit=BATCH_TIME_LIMIT,
+    )
+    batch_stats.record("deleteInvitations", metrics)
+    return jsonify({"results": [dict(outcome, signUrl=url) for url, outcome in results], "metrics": metrics})
 
 
 @app.route("/mark_complete", methods=["POST"])
@@ -613,6 +1293,8 @@ def mark_complete():
         required: true
         schema:
           type: object
+          required:
+            - documentId
           properties:
             documentId:
               type: string
@@ -643,15 +1325,10 @@ def mark_complete():
     data = request.get_json()
 
     json_data = {"documentId": data["documentId"]}
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
-    response = requests.post(url=f"{SANDBOX_URL}/complete", headers=headers, json=json_data)
+    headers = {"X-Auth-Token": g.tenant.token}
+    response = g.tenant.session.post(url=f"{g.tenant.sandbox_url}/complete", headers=headers, json=json_data)
 
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
-
-    return jsonify(response_json), response.status_code
+    return _upstream_json_response(response)
 
 
 @app.route("/check_document", methods=["GET"])
@@ -700,16 +1377,11 @@ def check_document():
     """
     document_id = request.args.get("documentId", None)
 
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     params = {"documentId": document_id}
-    response = requests.get(url=f"{SANDBOX_URL}/document/details", headers=headers, params=params)
-
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
+    response = g.tenant.session.get(url=f"{g.tenant.sandbox_url}/document/details", headers=headers, params=params)
 
-    return jsonify(response_json), response.status_code
+    return _upstream_json_response(response)
 
 
 @app.route("/check_list_of_completed_documents", methods=["GET"])
@@ -788,7 +1460,7 @@ def check_list_of_completed_documents():
               error: "Error: Internal Server Error"
     """
     args = request.args
-    headers = {"X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"X-Auth-Token": g.tenant.token}
     parameters = {
         "max": args.get("max"),
         "offset": args.get("offset"),
@@ -798,14 +1470,9 @@ def check_list_of_completed_documents():
         "startDate": args.get("startDate"),
         "endDate": args.get("endDate")
     }
-    response = requests.get(f"{SANDBOX_URL}/document/completed", headers=headers, params=parameters)
-
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
+    response = g.tenant.session.get(f"{g.tenant.sandbox_url}/document/completed", headers=headers, params=parameters)
 
-    return jsonify(response_json), response.status_code
+    return _upstream_json_response(response)
 
 
 @app.route("/esign_docsigner_invitation", methods=["POST"])
@@ -825,6 +1492,10 @@ def esign_docsigner_invitation():
         required: true
         schema:
           type: object
+          required:
+            - signUrl
+            - profileId
+            - consent
           properties:
             signUrl:
               type: string
@@ -863,26 +1534,25 @@ def esign_docsigner_invitation():
               error: "Error: Internal Server Error"
     """
     data = request.get_json()
-    url = f"{SANDBOX_BASE_URL}/sign/docSigner/invitation"
-    url = SANDBOX_BASE_URL + "/sign/docSigner/invitation"
+    url = f"{g.tenant.sandbox_base_url}/sign/docSigner/invitation"
+    url = g.tenant.sandbox_base_url + "/sign/docSigner/invitation"
     sign_url = data["signUrl"]
     profile_id = data["profileId"]
     consent = data["consent"]
-    headers = {"Content-Type": "application/json", "X-Auth-Token": X_AUTH_TOKEN}
+    headers = {"Content-Type": "application/json", "X-Auth-Token": g.tenant.token}
     json_data = {
         "signUrl": sign_url,
         "profileId": profile_id,
         "consent": consent
     }
-    response = requests.post(url=url, headers=headers, json=json_data)
+    response = g.tenant.session.post(url=url, headers=headers, json=json_data)
+
+    return _upstream_json_response(response)
 
-    try:
-        response_json = response.json()
-    except Exception as e:
-        response_json = {"error": f"Unable to parse response JSON: {str(e)}"}
 
-    return jsonify(response_json), response.status_code
+init_validation(app)
 
 
 if __name__ == "__main__":
-    app.run(port=5555, debug=True)
+    # Development server only, use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    app.run(port=5555, debug=os.getenv("FLASK_DEBUG", "true").lower() == "true")
@@ -0,0 +1,119 @@
+"""
+Concurrent fan-out of upstream calls over large lists.
+
+Items are split into upstream-sized batches which run on a bounded thread
+pool. Every item gets its own result, so one failed batch doesn't hide the
+ones that went through.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_batches(items, batch_size, concurrency, call, rate_limiters=(), rate_limit_timeout=None, dry_run=False,
+                on_batch_done=None, slots=None, time_limit=None):
+    """
+    Run `call(batch)` for every batch of `items` and return (results, metrics).
+
+    `call` returns a dict with at least a "success" key, which is copied into
+    the result of every item of the batch. Each call first takes a token from
+    every rate limiter in `rate_limiters` (None entries are skipped), then a
+    slot from the `slots` semaphore,
+    which is shared by all runs using the same connection pool so that
+    concurrent runs together stay within its size. Batches not started
+    within `time_limit` seconds fail without calling the upstream; `call`
+    should bound its own upstream call by the time left.
+    `on_batch_done(batch, outcome)` is called from the worker thread as soon
+    as a batch finishes.
+    """
+    start = time.perf_counter()
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    batches = chunked(items, batch_size)
+
+    def remaining():
+        return None if deadline is None else deadline - time.monotonic()
+
+    def attempt(batch):
+        if dry_run:
+            return {"success": True, "dryRun": True}
+        timeout, error = rate_limit_timeout, "Rate limit exceeded"
+        if deadline is not None:
+            left = remaining()
+            if left <= 0:
+                return {"success": False, "error": "Time limit exceeded"}
+            if timeout is None or left < timeout:
+                timeout, error = left, "Time limit exceeded"
+        for rate_limiter in rate_limiters:
+            if rate_limiter is not None and not rate_limiter.acquire(timeout):
+                return {"success": False, "error": error}
+        if slots is not None and not slots.acquire(timeout=None if deadline is None else max(0, remaining())):
+            return {"success": False, "error": "Time limit exceeded"}
+        try:
+            return call(batch)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def run(batch):
+        outcome = attempt(batch)
+        if on_batch_done is not None:
+            on_batch_done(batch, outcome)
+        return outcome
+
+    # Run each batch in a copy of the caller's context so tracing spans
+    # started in the worker threads attach to the current request
+    contexts = [copy_context() for _ in batches]
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+        outcomes = list(pool.map(lambda context, batch: context.run(run, batch), contexts, batches))
+
+    results = []
+    for batch, outcome in zip(batches, outcomes):
+        for item in batch:
+            results.append((item, outcome))
+
+    elapsed = time.perf_counter() - start
+    succeeded = sum(1 for _, outcome in results if outcome["success"])
+    metrics = {
+        "items": len(results),
+        "batches": len(batches),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsedMs": round(elapsed * 1000, 1),
+        "itemsPerSecond": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "dryRun": dry_run,
+    }
+    return results, metrics
+
+
+class BatchStats:
+    """Running totals of the batch endpoints for /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, name, metrics):
+        if metrics["dryRun"]:
+            return
+        with self._lock:
+            totals = self._totals.setdefault(name, {"runs": 0, "items": 0, "batches": 0, "failed": 0, "elapsedMs": 0.0})
+            totals["runs"] += 1
+            totals["items"] += metrics["items"]
+            totals["batches"] += metrics["batches"]
+            totals["failed"] += metrics["failed"]
+            totals["elapsedMs"] += metrics["elapsedMs"]
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for name, totals in self._totals.items():
+                seconds = totals["elapsedMs"] / 1000
+                snapshot[name] = dict(totals, itemsPerSecond=round(totals["items"] / seconds, 1) if seconds else 0.0)
+            return snapshot
@@ -0,0 +1,45 @@
+"""
+Measure requests per second against a running gateway.
+
+    python bench_throughput.py http://localhost:5555/apidocs/ --requests 2000 --concurrency 32
+"""
+import argparse
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url) as response:
+            response.read()
+            ok = response.status < 500
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(fetch, [args.url] * args.requests))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for ok, _ in results if not ok)
+    print(f"requests:    {len(results)} ({errors} errors)")
+    print(f"concurrency: {args.concurrency}")
+    print(f"throughput:  {len(results) / elapsed:.1f} req/s")
+    print(f"latency p50: {latencies[len(latencies) // 2] * 1000:.1f} ms")
+    print(f"latency p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Compare the compiled request validators with per-request jsonschema.
+
+    python bench_validation.py [--iterations 20000]
+"""
+import argparse
+import timeit
+
+import jsonschema
+
+import app
+from validation import compile_schema, parse_docstring_spec
+
+PAYLOAD = {
+    "signUrl": "https://sandbox.leegality.com/sign/73bca1a0-9bdd-4b5b-80ff-34d4a144e78b",
+    "profileId": "profile123",
+    "consent": True,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    spec = parse_docstring_spec(app.esign_docsigner_invitation)
+    schema = next(p["schema"] for p in spec["parameters"] if p["in"] == "body")
+    compiled = compile_schema(schema)
+    validator = jsonschema.Draft4Validator(schema)
+
+    candidates = [
+        ("jsonschema.validate per request", lambda: jsonschema.validate(PAYLOAD, schema)),
+        ("jsonschema validator reused", lambda: validator.validate(PAYLOAD)),
+        ("compiled validator", lambda: compiled(PAYLOAD)),
+    ]
+    print(f"{'validator':<34} {'us/request':>10}")
+    for name, run in candidates:
+        seconds = min(timeit.repeat(run, number=args.iterations, repeat=3))
+        print(f"{name:<34} {seconds / args.iterations * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Content-addressed store for uploaded agreement files.
+
+Uploads are hashed (SHA-256) while they are streamed to disk, so the same
+document is only ever stored once no matter how many times it is submitted.
+The base64 encoding sent to the upstream is cached next to the raw file and
+the least recently used entries are evicted once the disk budget is exceeded.
+Files can be kept apart per tenant by passing a namespace, which is stored as
+a subdirectory of the root; the disk budget is shared by all namespaces.
+
+Several processes (e.g. gunicorn workers) can share the same root. Each
+one rebuilds its index from disk at most every `rescan_interval` seconds, so
+the budget applies to the directory as a whole; in between, files stored by
+other processes aren't counted and the directory can overshoot the budget
+by what they store in that time.
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+BLOB_SUFFIX = ".bin"
+BASE64_SUFFIX = ".b64"
+
+
+class FileStore:
+    def __init__(self, root, max_bytes, rescan_interval=10.0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        # A hit is a stored file being reused (uploaded again or referenced
+        # by its digest), a miss is a new file being stored
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key ("digest" or "namespace/digest") -> bytes used on disk
+        # (raw file + cached base64), oldest first
+        os.makedirs(self.root, exist_ok=True)
+        self._entries = self._scan()
+        self._size = sum(self._entries.values())
+        self._scanned = time.monotonic()
+        self._scanning = False
+        self._lock = threading.Lock()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.root, key + suffix)
+
+    def _directory(self, namespace):
+        if namespace is None:
+            return self.root
+        directory = os.path.join(self.root, namespace)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _scan(self):
+        # Build the index from disk, using mtime as the last access time,
+        # which also picks up files stored or evicted by other processes
+        sizes = {}
+        mtimes = {}
+        for directory, _, filenames in os.walk(self.root):
+            prefix = os.path.relpath(directory, self.root)
+            for filename in filenames:
+                name, suffix = os.path.splitext(filename)
+                if suffix not in (BLOB_SUFFIX, BASE64_SUFFIX):
+                    continue
+                key = name if prefix == "." else f"{prefix}/{name}"
+                try:
+                    stat = os.stat(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    continue
+                sizes[key] = sizes.get(key, 0) + stat.st_size
+                mtimes[key] = max(mtimes.get(key, 0), stat.st_mtime)
+        return OrderedDict((key, sizes[key]) for key in sorted(sizes, key=mtimes.get))
+
+    def _touch(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key, BLOB_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, key):
+        self._size -= self._entries.pop(key, 0)
+        for suffix in (BLOB_SUFFIX, BASE64_SUFFIX):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _enforce_budget(self, keep):
+        """Evict down to the budget, rescanning the directory first when one is due."""
+        with self._lock:
+            if self._scanning or time.monotonic() - self._scanned < self.rescan_interval:
+                self._evict(keep)
+                return
+            self._scanning = True
+        # Walk the directory without the lock so cached lookups aren't held up
+        try:
+            entries = self._scan()
+        except BaseException:
+            with self._lock:
+                self._scanning = False
+            raise
+        with self._lock:
+            self._entries = entries
+            self._size = sum(entries.values())
+            self._scanned = time.monotonic()
+            self._scanning = False
+            self._evict(keep)
+
+    def _evict(self, keep):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            self._forget(key)
+            self.evictions += 1
+
+    def put(self, stream, namespace=None):
+        """Stream a file-like object into the store and return its digest."""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory(namespace), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            key = _key(digest, namespace)
+            with self._lock:
+                if os.path.exists(self._path(key, BLOB_SUFFIX)):
+                    self.hits += 1
+                    if key not in self._entries:
+                        # Stored by another worker sharing the directory
+                        self._entries[key] = size
+                        self._size += size
+                    self._touch(key)
+                    return digest
+                os.replace(tmp_path, self._path(key, BLOB_SUFFIX))
+                self.misses += 1
+                self._entries[key] = size
+                self._size += size
+            self._enforce_budget(keep=key)
+            return digest
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def size(self, digest, namespace=None):
+        """Return the size in bytes of a stored file, or None if it is unknown."""
+        if not _valid_digest(digest):
+            return None
+        try:
+            return os.stat(self._path(_key(digest, namespace), BLOB_SUFFIX)).st_size
+        except FileNotFoundError:
+            return None
+
+    def get_base64(self, digest, namespace=None):
+        """
+        Return (encoding, cached) for a stored file, or (None, False) if it is unknown.
+
+        `cached` tells whether the base64 encoding came from the cache rather
+        than being computed by this call.
+        """
+        if not _valid_digest(digest):
+            return None, False
+        key = _key(digest, namespace)
+        encoded_path = self._path(key, BASE64_SUFFIX)
+        try:
+            with open(encoded_path, "r") as f:
+                encoded = f.read()
+            with self._lock:
+                self.hits += 1
+                self._touch(key)
+            return encoded, True
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(self._path(key, BLOB_SUFFIX), "rb") as f:
+                encoded = base64.b64encode(f.read()).decode("ascii")
+        except FileNotFoundError:
+            # Evicted, possibly by another worker sharing the directory
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None, False
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory(namespace), suffix=".tmp")
+        with os.fdopen(fd, "w") as out:
+            out.write(encoded)
+        with self._lock:
+            self.hits += 1
+            stored = not os.path.exists(encoded_path)
+            if stored:
+                os.replace(tmp_path, encoded_path)
+                self._entries[key] = self._entries.get(key, 0) + len(encoded)
+                self._size += len(encoded)
+            else:
+                # Encoded concurrently by another thread or worker, already counted
+                os.remove(tmp_path)
+            self._touch(key)
+        if stored:
+            self._enforce_budget(keep=key)
+        return encoded, False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def _valid_digest(digest):
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest)
+
+
+def _key(digest, namespace):
+    return digest if namespace is None else f"{namespace}/{digest}"
@@ -0,0 +1,77 @@
+"""
+Gunicorn settings for running the gateway in production.
+
+Every value can be overridden from the environment so the same file is used
+in every deployment:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Send SIGHUP to the master for a graceful reload: new workers are started
+with the new code and old ones finish their in-flight requests first.
+"""
+import math
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5555")
+
+
+def _read_cgroup_cpu_limit():
+    # cgroup v2, then v1; None when the container has no CPU quota
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    """CPUs this process may use: its affinity mask, capped by a container CPU quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = multiprocessing.cpu_count()
+    limit = _read_cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+# The gateway mostly waits on the upstream, so threads are cheap and let a
+# worker overlap several upstream calls. Workers scale with the CPUs actually
+# available, not the host's, so a small container on a big node isn't
+# started with hundreds of workers.
+workers = int(os.getenv("GUNICORN_WORKERS", available_cpus() * 2 + 1))
+# The app splits per-tenant rate limits between the workers
+os.environ["GUNICORN_WORKERS"] = str(workers)
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+
+# Import the app once in the master so workers fork with it already loaded.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers periodically to bound memory growth; the jitter keeps
+# them from all restarting at the same time.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Upstream signing calls can be slow, allow them to finish.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# Keep connections from the load balancer open between requests. This has to
+# be longer than the load balancer's own idle timeout.
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 75))
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+errorlog = os.getenv("GUNICORN_ERRORLOG", "-")
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
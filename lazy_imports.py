@@ -0,0 +1,23 @@
+"""
+Deferred imports for a faster cold start.
+
+A module returned by lazy_import() is registered in sys.modules right away
+but only executed on the first attribute access, so its import cost moves
+from worker startup to the first request that actually needs it.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
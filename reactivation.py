@@ -0,0 +1,222 @@
+"""
+Bulk reactivation of expired documents.
+
+A job reactivates a list of documents with bounded concurrency and an
+optional rate limit. Its progress is appended to a log file as each
+document finishes, so a job interrupted by a crash or a worker restart
+can be resumed and will skip the documents already reactivated.
+
+For a job ID, the state directory holds:
+
+    <job_id>.json            job metadata (documents, tenant, timestamps, status)
+    <job_id>.progress.jsonl  one line per finished document
+    <job_id>.lock            locked while the job runs, by any worker process
+
+The lock is released by the OS when its process dies, so a job whose
+metadata still says "running" but whose lock is free was interrupted.
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, where only the single-process dev server runs
+    fcntl = None
+
+from batch import run_batches
+
+# Locks of running jobs when fcntl isn't available, by lock file path
+_local_locks = set()
+_local_locks_lock = threading.Lock()
+
+
+class ReactivationJob:
+    def __init__(self, job_id, state_dir, document_ids=None, tenant_id=None):
+        self.job_id = job_id
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        self._lock_file = None
+        os.makedirs(state_dir, exist_ok=True)
+        if document_ids is not None:
+            self.meta = {
+                "jobId": job_id,
+                "tenantId": tenant_id,
+                "documentIds": list(dict.fromkeys(document_ids)),
+                "status": "pending",
+                "createdAt": time.time(),
+                "startedAt": None,
+                "finishedAt": None,
+                "elapsedMs": 0.0,
+            }
+            self._save_meta()
+        else:
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+
+    @classmethod
+    def create(cls, state_dir, document_ids, tenant_id=None):
+        return cls(uuid.uuid4().hex, state_dir, document_ids, tenant_id)
+
+    @classmethod
+    def load(cls, state_dir, job_id):
+        """Load an existing job, or return None if there is none with this ID."""
+        if not job_id.isalnum():
+            return None
+        try:
+            return cls(job_id, state_dir)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.state_dir, f"{self.job_id}.json")
+
+    @property
+    def _progress_path(self):
+        return os.path.join(self.state_dir, f"{self.job_id}.progress.jsonl")
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.state_dir, f"{self.job_id}.lock")
+
+    def try_lock(self):
+        """Take the job's lock for running it; False if another thread or process holds it."""
+        if fcntl is None:
+            with _local_locks_lock:
+                if self._lock_path in _local_locks:
+                    return False
+                _local_locks.add(self._lock_path)
+                self._lock_file = True
+                return True
+        lock_file = open(self._lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def unlock(self):
+        if self._lock_file is None:
+            return
+        if fcntl is None:
+            with _local_locks_lock:
+                _local_locks.discard(self._lock_path)
+        else:
+            # Closing the file releases the flock
+            self._lock_file.close()
+        self._lock_file = None
+
+    def is_running(self):
+        """Whether some thread or process currently holds the job's lock."""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            with _local_locks_lock:
+                return self._lock_path in _local_locks
+        try:
+            lock_file = open(self._lock_path)
+        except FileNotFoundError:
+            return False
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return False
+
+    def _save_meta(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def progress(self):
+        """Latest outcome of every finished document, by document ID."""
+        outcomes = {}
+        try:
+            with open(self._progress_path) as f:
+                for line in f:
+                    try:
+                        outcome = json.loads(line)
+                    except ValueError:
+                        # Partial last line from a crash mid-write
+                        continue
+                    outcomes[outcome["documentId"]] = outcome
+        except FileNotFoundError:
+            pass
+        return outcomes
+
+    def run(self, reactivate, concurrency, rate_limiters=(), rate_limit_timeout=None, slots=None):
+        """
+        Reactivate every document not already reactivated and return the report.
+
+        The caller holds the job's lock (see try_lock) for the whole run.
+        """
+        done = {doc_id for doc_id, outcome in self.progress().items() if outcome["success"]}
+        pending = [doc_id for doc_id in self.meta["documentIds"] if doc_id not in done]
+
+        self.meta["status"] = "running"
+        self.meta["startedAt"] = self.meta["startedAt"] or time.time()
+        self.meta["owner"] = {"host": socket.gethostname(), "pid": os.getpid()}
+        self._save_meta()
+
+        start = time.perf_counter()
+        with open(self._progress_path, "a+") as progress:
+            # Terminate a partial last line left by a crash so new lines parse
+            if progress.tell():
+                progress.seek(progress.tell() - 1)
+                if progress.read(1) != "\n":
+                    progress.write("\n")
+
+            def record(batch, outcome):
+                with self._lock:
+                    progress.write(json.dumps(dict(outcome, documentId=batch[0])) + "\n")
+                    progress.flush()
+
+            try:
+                run_batches(
+                    pending, 1, concurrency, lambda batch: reactivate(batch[0]),
+                    rate_limiters=rate_limiters, rate_limit_timeout=rate_limit_timeout,
+                    on_batch_done=record, slots=slots,
+                )
+                self.meta["status"] = "finished"
+            except BaseException:
+                self.meta["status"] = "failed"
+                raise
+            finally:
+                self.meta["elapsedMs"] += round((time.perf_counter() - start) * 1000, 1)
+                self.meta["finishedAt"] = time.time()
+                self._save_meta()
+        return self.report()
+
+    def report(self):
+        outcomes = self.progress()
+        succeeded = [doc_id for doc_id, outcome in outcomes.items() if outcome["success"]]
+        failed = [outcome for outcome in outcomes.values() if not outcome["success"]]
+        total = len(self.meta["documentIds"])
+        seconds = self.meta["elapsedMs"] / 1000
+        status = self.meta["status"]
+        if status == "running" and not self.is_running():
+            # Its worker died mid-run, e.g. recycled or killed on timeout
+            status = "interrupted"
+        return {
+            "jobId": self.job_id,
+            "tenantId": self.meta["tenantId"],
+            "status": status,
+            "total": total,
+            "succeeded": len(succeeded),
+            "failed": len(failed),
+            "pending": total - len(succeeded) - len(failed),
+            "elapsedMs": self.meta["elapsedMs"],
+            "documentsPerSecond": round(len(outcomes) / seconds, 1) if seconds else 0.0,
+            "failures": failed[:100],
+        }
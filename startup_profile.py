@@ -0,0 +1,88 @@
+"""
+Report what importing app.py costs.
+
+    python startup_profile.py [--runs 5] [--top 25] [--budget-ms 500]
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter, lists
+the self time of every top-level package it loads and the cumulative time
+of each module app.py imports directly, then times a few plain cold starts.
+With --budget-ms the exit status is 1 when the median cold start is over
+budget, so it can be used as a CI check. Environment variables (e.g.
+LAZY_IMPORTS, SWAGGER_ENABLED) are passed through to the child process.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def cold_start_ms():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float)
+    args = parser.parse_args()
+
+    rows = import_times()
+
+    by_package = {}
+    for name, _, self_us, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    print(f"{'package':<30} {'self ms':>10}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<30} {self_us / 1000:>10.1f}")
+
+    # Modules are listed after everything they import, so the direct imports
+    # of app.py are the rows one level deeper that precede it
+    app_index = next(i for i, row in enumerate(rows) if row[0] == "app")
+    app_depth, total_us = rows[app_index][1], rows[app_index][3]
+    direct = []
+    for name, depth, _, cumulative_us in reversed(rows[:app_index]):
+        if depth <= app_depth:
+            break
+        if depth == app_depth + 1:
+            direct.append((name, cumulative_us))
+    print()
+    print(f"{'imported by app.py':<30} {'cumulative ms':>14}")
+    for name, cumulative_us in reversed(direct):
+        print(f"{name:<30} {cumulative_us / 1000:>14.1f}")
+    print(f"{'total':<30} {total_us / 1000:>14.1f}")
+
+    timings = [cold_start_ms() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print()
+    print(f"cold start (interpreter + import app), median of {args.runs}: {median:.1f} ms")
+
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"over budget of {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Tenant-aware upstream settings.
+
+Each tenant has its own upstream token, base URLs, connection pool, rate
+limit and file store namespace. Tenants are loaded from a JSON file which is
+re-read when it changes on disk:
+
+    {
+      "tenants": {
+        "retail": {
+          "tokenEnv": "RETAIL_X_AUTH_TOKEN",
+          "sandboxUrl": "https://sandbox.leegality.com/api/v3.0/document",
+          "sandboxBaseUrl": "https://sandbox.leegality.com/api/v3.0",
+          "apiKeys": ["retail-key-1"],
+          "poolSize": 10,
+          "rateLimit": 5,
+          "burst": 10,
+          "cacheNamespace": "retail"
+        }
+      }
+    }
+
+rateLimit (calls per second) and burst are for the whole server: each
+worker process enforces its share, the configured values divided by the
+number of workers.
+
+A request picks its tenant with the X-Api-Key header, or with X-Tenant-Id
+for tenants configured without apiKeys. A tenant with apiKeys is only
+picked by X-Tenant-Id for clients in one of the trusted networks. Requests
+sending neither header get the default tenant built from the environment,
+whose ID "default" can't be used in the config file.
+"""
+import ipaddress
+import json
+import os
+import re
+import threading
+import time
+
+import tracing
+
+NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+DEFAULT_TENANT_ID = "default"
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available, else return the seconds to wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """Block until a token is available; False if that takes longer than timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Tenant:
+    def __init__(self, tenant_id, token, sandbox_url, sandbox_base_url, api_keys=(),
+                 pool_size=10, rate_limit=None, burst=None, cache_namespace=None):
+        if cache_namespace is not None and not NAMESPACE_PATTERN.match(cache_namespace):
+            raise ValueError(f"Invalid cacheNamespace for tenant {tenant_id!r}: {cache_namespace!r}")
+        self.tenant_id = tenant_id
+        self.token = token
+        self.sandbox_url = sandbox_url
+        self.sandbox_base_url = sandbox_base_url
+        self.api_keys = tuple(api_keys)
+        self.pool_size = pool_size
+        self.rate_limiter = RateLimiter(rate_limit, burst) if rate_limit else None
+        # Shared by every batch run of this tenant so that together they
+        # don't open more connections than the pool keeps
+        self.batch_slots = threading.BoundedSemaphore(pool_size)
+        self.cache_namespace = cache_namespace
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, tenant_id, config, workers=1):
+        """
+        Build a tenant from its config file entry; raises ValueError if it is invalid.
+
+        The rate limit is enforced separately by each of the `workers` server
+        processes, so each of them gets its share of the configured rate.
+        """
+        if not isinstance(config, dict):
+            raise ValueError(f"Tenant {tenant_id!r} must be an object")
+        if not isinstance(config.get("sandboxUrl"), str):
+            raise ValueError(f"sandboxUrl of tenant {tenant_id!r} must be a string")
+        api_keys = config.get("apiKeys", [])
+        if not isinstance(api_keys, list) or not all(isinstance(key, str) and key for key in api_keys):
+            raise ValueError(f"apiKeys of tenant {tenant_id!r} must be a list of strings")
+        pool_size = config.get("poolSize", 10)
+        if isinstance(pool_size, bool) or not isinstance(pool_size, int) or pool_size < 1:
+            raise ValueError(f"poolSize of tenant {tenant_id!r} must be a positive integer")
+        for name in ("rateLimit", "burst"):
+            value = config.get(name)
+            if value is not None and (not _is_number(value) or value <= 0):
+                raise ValueError(f"{name} of tenant {tenant_id!r} must be a positive number")
+
+        token = config.get("token")
+        if token is None and "tokenEnv" in config:
+            token = os.getenv(config["tokenEnv"])
+        rate_limit = config.get("rateLimit")
+        burst = config.get("burst") or rate_limit
+        return cls(
+            tenant_id,
+            token=token,
+            sandbox_url=config["sandboxUrl"],
+            sandbox_base_url=config.get("sandboxBaseUrl"),
+            api_keys=api_keys,
+            pool_size=pool_size,
+            rate_limit=rate_limit / workers if rate_limit else None,
+            burst=max(1, burst / workers) if burst else None,
+            cache_namespace=config.get("cacheNamespace", tenant_id),
+        )
+
+    @property
+    def session(self):
+        """HTTP session with a connection pool of its own, created on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = tracing.new_session(self.pool_size)
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+class TenantRegistry:
+    def __init__(self, default_tenant=None, config_path=None, reload_interval=5.0, trusted_networks=(), workers=1):
+        self.default_tenant = default_tenant
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self.workers = workers
+        self.trusted_networks = [ipaddress.ip_network(network) for network in trusted_networks]
+        self._tenants = {}
+        self._configs = {}
+        self._api_keys = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        if config_path:
+            self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.config_path).st_mtime
+        except FileNotFoundError:
+            print(f"Tenant config {self.config_path} not found")
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.config_path) as f:
+                configs = json.load(f)["tenants"]
+            if DEFAULT_TENANT_ID in configs:
+                raise ValueError(f"tenant ID {DEFAULT_TENANT_ID!r} is reserved for the environment settings")
+            tenants = {}
+            for tenant_id, config in configs.items():
+                if self._configs.get(tenant_id) == config:
+                    # Unchanged, keep its connection pool and rate limit state
+                    tenants[tenant_id] = self._tenants[tenant_id]
+                else:
+                    tenants[tenant_id] = Tenant.from_config(tenant_id, config, self.workers)
+        except Exception as e:
+            # Keep serving with the previous tenants until the file is fixed
+            print(f"Failed to load tenant config {self.config_path}: {e!r}")
+            return
+
+        for tenant_id, tenant in self._tenants.items():
+            if tenants.get(tenant_id) is not tenant:
+                tenant.close()
+        self._tenants = tenants
+        self._configs = configs
+        self._api_keys = {key: tenant for tenant in tenants.values() for key in tenant.api_keys}
+        self._mtime = mtime
+
+    def _maybe_reload(self):
+        if not self.config_path:
+            return
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked >= self.reload_interval:
+                self._checked = now
+                self._reload()
+
+    def _trusted(self, remote_addr):
+        try:
+            address = ipaddress.ip_address(remote_addr or "")
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_networks)
+
+    def get(self, tenant_id=None):
+        """Return a tenant by ID without checking credentials, for local tools like the CLI."""
+        self._maybe_reload()
+        if tenant_id is None or (self.default_tenant is not None and tenant_id == self.default_tenant.tenant_id):
+            return self.default_tenant
+        return self._tenants.get(tenant_id)
+
+    def resolve(self, tenant_id=None, api_key=None, remote_addr=None):
+        """Return the tenant for a tenant ID or API key, or None if unknown or not allowed."""
+        self._maybe_reload()
+        if api_key:
+            tenant = self._api_keys.get(api_key)
+            if tenant is None or (tenant_id and tenant_id != tenant.tenant_id):
+                return None
+            return tenant
+        if tenant_id:
+            tenant = self.get(tenant_id)
+            # The tenant ID alone isn't a credential for tenants with API keys
+            if tenant is None or (tenant.api_keys and not self._trusted(remote_addr)):
+                return None
+            return tenant
+        return self.default_tenant
+
+    def tenants(self):
+        self._maybe_reload()
+        return dict(self._tenants)
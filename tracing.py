@@ -0,0 +1,255 @@
+"""
+Per-request tracing.
+
+Every request gets a trace whose spans cover the phases the gateway goes
+through (body parse, file read, base64 encode, upstream connect, upstream
+wait, response parse, jsonify). Upstream calls carry a W3C `traceparent`
+header, and an incoming `traceparent` is continued.
+
+Traces are tail sampled: the keep/drop decision is made once a request has
+finished, so every slow or failed request is kept and only a fraction of
+the others. Kept traces go to stdout or to a JSON lines file, one trace per
+line, so they can be inspected without a collector.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# (trace, span) the code currently runs in, None outside traced requests
+_current = ContextVar("current_span", default=None)
+# End time of the last upstream connection opened by the current upstream call
+_connect_end_ns = ContextVar("connect_end_ns", default=None)
+
+
+class Span:
+    def __init__(self, name, parent_id=None, attributes=None, start_ns=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+
+    def end(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "startTimeUnixNano": self.start_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.parent_id = parent_id
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name, parent=None, attributes=None, start_ns=None):
+        span = Span(name, parent.span_id if parent else self.parent_id, attributes, start_ns)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def to_dict(self):
+        root = self.spans[0]
+        return {
+            "traceId": self.trace_id,
+            "name": root.name,
+            "durationMs": root.to_dict()["durationMs"],
+            "attributes": root.attributes,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+def current_span():
+    current = _current.get()
+    return current[1] if current else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the current span; a no-op outside traces."""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    child = trace.start_span(name, parent, attributes)
+    token = _current.set((trace, child))
+    try:
+        yield child
+    finally:
+        child.end()
+        _current.reset(token)
+
+
+def traceparent():
+    """W3C trace context header value for the current span, or None."""
+    current = _current.get()
+    if current is None:
+        return None
+    trace, parent = current
+    return f"00-{trace.trace_id}-{parent.span_id}-01"
+
+
+class ConsoleExporter:
+    def export(self, trace):
+        print(json.dumps(trace.to_dict()), flush=True)
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict()) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+def init_tracing(app, exporter, slow_ms=1000, sample_rate=0.01):
+    """Trace every request of `app`; does nothing when exporter is None."""
+    if exporter is None:
+        return
+
+    @app.before_request
+    def start_trace():
+        match = TRACEPARENT_PATTERN.match(request.headers.get("traceparent", ""))
+        trace = Trace(*match.groups()) if match else Trace()
+        root = trace.start_span(f"{request.method} {request.path}", attributes={
+            "http.method": request.method,
+            "http.route": str(request.url_rule) if request.url_rule else None,
+        })
+        g.trace_token = _current.set((trace, root))
+
+    @app.after_request
+    def record_status(response):
+        current = _current.get()
+        if current is not None:
+            current[1].attributes["http.status_code"] = response.status_code
+            response.headers["X-Trace-Id"] = current[0].trace_id
+        return response
+
+    @app.teardown_request
+    def finish_trace(error=None):
+        token = g.pop("trace_token", None)
+        if token is None:
+            return
+        trace, root = _current.get()
+        _current.reset(token)
+        root.end()
+        if error is not None:
+            root.attributes["error"] = repr(error)
+
+        # Tail sampling: keep slow and failed requests, sample the rest
+        duration_ms = (root.end_ns - root.start_ns) / 1e6
+        failed = error is not None or root.attributes.get("http.status_code", 500) >= 500
+        if duration_ms >= slow_ms or failed or random.random() < sample_rate:
+            exporter.export(trace)
+
+
+_session_class = None
+# LazyLoader isn't thread safe before Python 3.12, so the first load of a
+# lazily imported requests must not run in two threads at once
+_session_class_lock = threading.Lock()
+
+
+def new_session(pool_maxsize):
+    """
+    requests session whose upstream calls are traced and carry `traceparent`.
+
+    requests and urllib3 are imported here rather than at module level so
+    LAZY_IMPORTS keeps deferring them.
+    """
+    global _session_class
+    if _session_class is None:
+        with _session_class_lock:
+            if _session_class is None:
+                _session_class = _build_session_class()
+    return _session_class(pool_maxsize)
+
+
+def _build_session_class():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def traced_connect(connection, connect):
+        with span("upstream_connect", **{"net.peer.name": connection.host}) as connect_span:
+            connect()
+        if connect_span is not None:
+            _connect_end_ns.set(connect_span.end_ns)
+
+    class TracedHTTPConnection(HTTPConnection):
+        def connect(self):
+            traced_connect(self, super().connect)
+
+    class TracedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            traced_connect(self, super().connect)
+
+    class TracedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TracedHTTPConnection
+
+    class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TracedHTTPSConnection
+
+    class TracedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": TracedHTTPConnectionPool,
+                "https": TracedHTTPSConnectionPool,
+            }
+
+        def send(self, request, **kwargs):
+            parent = current_span()
+            start_ns = time.time_ns()
+            token = _connect_end_ns.set(None)
+            try:
+                response = super().send(request, **kwargs)
+                connect_end_ns = _connect_end_ns.get()
+            finally:
+                _connect_end_ns.reset(token)
+            if parent is not None:
+                # Time from the connection being ready to the response headers
+                trace = _current.get()[0]
+                trace.start_span("upstream_wait", parent, start_ns=connect_end_ns or start_ns).end()
+            return response
+
+    class TracedSession(requests.Session):
+        def __init__(self, pool_maxsize):
+            super().__init__()
+            adapter = TracedAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            self.mount("http://", adapter)
+            self.mount("https://", adapter)
+
+        def send(self, request, **kwargs):
+            with span("upstream", **{"http.method": request.method, "http.url": request.url.split("?")[0]}) as upstream:
+                if upstream is not None:
+                    request.headers["traceparent"] = traceparent()
+                response = super().send(request, **kwargs)
+                if upstream is not None:
+                    upstream.attributes["http.status_code"] = response.status_code
+                return response
+
+    return TracedSession